@@ -23,9 +23,18 @@ Scatter: severity_score vs pm2_5
 '''
 # etl_analysis.py
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import matplotlib
+matplotlib.use("Agg")  # headless: render straight to PNG buffers
 import matplotlib.pyplot as plt
+# let Agg merge near-collinear line segments before rasterizing
+plt.rcParams["path.simplify"] = True
+plt.rcParams["path.simplify_threshold"] = 1.0
 from dotenv import load_dotenv
 from supabase import create_client
 
@@ -42,61 +51,126 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 PROCESSED_DIR = Path("data/processed")
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
-# helper: fetch table
-def fetch_table_as_df(table_name="air_quality_data"):
+# Local Parquet copy written by transform.py; read instead of Supabase when present
+STAGED_PARQUET = Path("data/staged/air_quality_transformed.parquet")
+# transform.py column names → Supabase column names used below
+STAGED_RENAME = {"AQI_Category": "aqi_category", "severity": "severity_score", "Risk_Level": "risk_flag"}
+
+# PostgREST caps a single response at 1000 rows, so larger tables are
+# read in explicit range windows fetched concurrently
+PAGE_SIZE = int(os.getenv("FETCH_PAGE_SIZE", "1000"))
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+
+# helper: unwrap a supabase response
+def response_field(res, field):
+    # res may be object with .data/.count or dict
+    if hasattr(res, field):
+        return getattr(res, field)
+    if isinstance(res, dict):
+        return res.get(field)
+    return None
+
+# helper: fetch all rows of a Supabase table
+def fetch_supabase_rows(table_name):
     # Supabase client: use postgrest select
     try:
-        res = supabase.table(table_name).select("*").execute()
+        head = supabase.table(table_name).select("id", count="exact").limit(1).execute()
     except Exception as e:
         raise RuntimeError(f"Supabase query failed: {e}")
-    # res may be object with .data or dict
-    data = None
-    if hasattr(res, "data"):
-        data = res.data
-    elif isinstance(res, dict) and "data" in res:
-        data = res["data"]
+    total = response_field(head, "count")
+    if total is None:
+        # without a row count the pages cannot be planned; never report an empty table
+        raise RuntimeError(f"Supabase returned no row count for table {table_name}")
+
+    try:
+        def fetch_page(start):
+            res = (supabase.table(table_name).select("*").order("id")
+                   .range(start, start + PAGE_SIZE - 1).execute())
+            return response_field(res, "data") or []
+
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            pages = list(pool.map(fetch_page, range(0, total, PAGE_SIZE)))
+    except Exception as e:
+        raise RuntimeError(f"Supabase query failed: {e}")
+    return [row for page in pages for row in page]
+
+# helper: fetch table
+def fetch_table_as_df(table_name="air_quality_data"):
+    if STAGED_PARQUET.exists():
+        # same rows we just loaded, without the network round-trip
+        df = pd.read_parquet(STAGED_PARQUET).rename(columns=STAGED_RENAME)
     else:
-        # try to interpret res directly
-        data = res
-    if not data:
-        return pd.DataFrame()
-    df = pd.DataFrame(data)
+        data = fetch_supabase_rows(table_name)
+        if not data:
+            return pd.DataFrame()
+        # columnar build: avoids per-cell type inference over the list of dicts
+        df = pa.Table.from_pylist(data).to_pandas()
     # Convert time to datetime
     if "time" in df.columns:
         df["time"] = pd.to_datetime(df["time"], errors="coerce")
     # ensure numeric types
-    numeric_cols = ["pm2_5","pm10","ozone","carbon_monoxide","nitrogen_dioxide","sulphur_dioxide","uv_index","severity_score","hour"]
-    for c in numeric_cols:
+    # pm2_5/severity_score feed the KPIs and pm2_5/pm10/ozone the trends CSV,
+    # so they stay float64; the rest is never published and is held as
+    # float32 to halve the bytes scanned
+    numeric_cols = ["pm2_5","pm10","ozone","severity_score"]
+    scan_only_cols = ["carbon_monoxide","nitrogen_dioxide","sulphur_dioxide","uv_index"]
+    for c in numeric_cols + scan_only_cols:
         if c in df.columns:
             df[c] = pd.to_numeric(df[c], errors="coerce")
+    for c in scan_only_cols:
+        if c in df.columns:
+            df[c] = df[c].astype("float32")
+    if "hour" in df.columns:
+        df["hour"] = pd.to_numeric(df["hour"], errors="coerce")
+    # low-cardinality labels: group on integer codes instead of strings
+    for c in ("city", "risk_flag"):
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    return df
+
+def ensure_c_contiguous(df):
+    # groupby reductions slow down dramatically on strided (F-ordered)
+    # column buffers, so copy any such numeric column into a C-contiguous one
+    for c in df.select_dtypes("number").columns:
+        values = df[c].to_numpy()
+        if not values.flags.c_contiguous:
+            df[c] = np.ascontiguousarray(values)
     return df
 
 def compute_kpis(df):
-    # A. City with highest average PM2.5
-    avg_pm25 = df.groupby("city", as_index=False)["pm2_5"].mean().rename(columns={"pm2_5":"avg_pm2_5"})
-    top_pm25 = avg_pm25.sort_values("avg_pm2_5", ascending=False).head(1)
+    # Per-city averages and row counts in a single grouping pass
+    city_stats = df.groupby("city", sort=False, observed=True).agg(
+        avg_pm2_5=("pm2_5", "mean"),
+        avg_severity=("severity_score", "mean"),
+        total=("city", "size"),
+    )
+    avg_pm25 = city_stats[["avg_pm2_5"]].reset_index()
+    avg_sev = city_stats[["avg_severity"]].reset_index()
 
-    # City with highest severity score (average)
-    avg_sev = df.groupby("city", as_index=False)["severity_score"].mean().rename(columns={"severity_score":"avg_severity"})
-    top_sev = avg_sev.sort_values("avg_severity", ascending=False).head(1)
+    # A. City with highest average PM2.5 / highest severity score (average)
+    top_pm25 = city_stats["avg_pm2_5"].idxmax() if city_stats["avg_pm2_5"].notna().any() else None
+    top_sev = city_stats["avg_severity"].idxmax() if city_stats["avg_severity"].notna().any() else None
 
     # Percentage of High/Moderate/Low risk hours
-    risk_counts = df.groupby(["city","risk_flag"]).size().reset_index(name="count")
-    total_counts = df.groupby("city").size().reset_index(name="total")
-    risk_dist = risk_counts.merge(total_counts, on="city")
+    risk_counts = pd.crosstab(df["city"], df["risk_flag"])
+    risk_dist = risk_counts.stack().rename("count").reset_index()
+    risk_dist = risk_dist[risk_dist["count"] > 0].reset_index(drop=True)
+    # denominator is every hour of the city, including ones with no risk_flag
+    risk_dist["total"] = risk_dist["city"].map(city_stats["total"]).astype(int)
     risk_dist["percent"] = (risk_dist["count"] / risk_dist["total"] * 100).round(2)
 
     # Hour of day with worst AQI (highest average pm2_5)
-    worst_hour = df.groupby("hour", as_index=False)["pm2_5"].mean().sort_values("pm2_5", ascending=False).head(1)
+    hourly_pm25 = df.groupby("hour", sort=False)["pm2_5"].mean()
+    worst_hour = hourly_pm25.idxmax() if hourly_pm25.notna().any() else None
 
     # summary metrics table
     summary_metrics = {
-        "city_highest_avg_pm2_5": top_pm25.iloc[0]["city"] if not top_pm25.empty else None,
-        "highest_avg_pm2_5": float(top_pm25.iloc[0]["avg_pm2_5"]) if not top_pm25.empty else None,
-        "city_highest_avg_severity": top_sev.iloc[0]["city"] if not top_sev.empty else None,
-        "highest_avg_severity": float(top_sev.iloc[0]["avg_severity"]) if not top_sev.empty else None,
-        "worst_hour_of_day": int(worst_hour.iloc[0]["hour"]) if not worst_hour.empty else None,
-        "worst_hour_avg_pm2_5": float(worst_hour.iloc[0]["pm2_5"]) if not worst_hour.empty else None,
+        "city_highest_avg_pm2_5": top_pm25,
+        "highest_avg_pm2_5": float(city_stats.at[top_pm25, "avg_pm2_5"]) if top_pm25 is not None else None,
+        "city_highest_avg_severity": top_sev,
+        "highest_avg_severity": float(city_stats.at[top_sev, "avg_severity"]) if top_sev is not None else None,
+        "worst_hour_of_day": int(worst_hour) if worst_hour is not None else None,
+        "worst_hour_avg_pm2_5": float(hourly_pm25[worst_hour]) if worst_hour is not None else None,
     }
 
     summary_df = pd.DataFrame([summary_metrics])
@@ -104,65 +178,83 @@ def compute_kpis(df):
 
 def export_trends(df):
     # For each city, keep time, pm2_5, pm10, ozone
-    trends = df[["city","time","pm2_5","pm10","ozone"]].dropna(subset=["time"]).sort_values(["city","time"])
+    # df is already sorted by city/time in main()
+    trends = df[["city","time","pm2_5","pm10","ozone"]].dropna(subset=["time"])
     return trends
 
 def save_csvs(summary_df, risk_dist, trends):
     summary_df.to_csv(PROCESSED_DIR / "summary_metrics.csv", index=False)
     risk_dist.to_csv(PROCESSED_DIR / "city_risk_distribution.csv", index=False)
-    trends.to_csv(PROCESSED_DIR / "pollution_trends.csv", index=False)
+    # largest output: write it with Arrow's native CSV writer. Keep the
+    # unquoted pandas layout: Arrow always quotes its own header, so the
+    # header is written here and Arrow only writes the rows.
+    trends_tbl = pa.Table.from_pandas(trends.astype({"city": str, "time": "datetime64[s]"}), preserve_index=False)
+    with open(PROCESSED_DIR / "pollution_trends.csv", "wb") as f:
+        f.write((",".join(trends_tbl.column_names) + "\n").encode())
+        pacsv.write_csv(trends_tbl, f, write_options=pacsv.WriteOptions(
+            include_header=False, quoting_style="none", batch_size=65536))
     print("CSV outputs saved to data/processed/")
 
+def new_axes(fig, size):
+    # reuse the one canvas: wipe the previous plot (colorbar axes included)
+    fig.clf()
+    fig.set_size_inches(*size)
+    return fig.add_subplot()
+
 def make_plots(df):
+    # One Figure for every plot; clearing it is cheaper than building a new canvas
+    fig = plt.figure()
+
     # Histogram of PM2.5
-    plt.figure(figsize=(8,6))
-    df["pm2_5"].dropna().hist(bins=40)
-    plt.title("Histogram of PM2.5")
-    plt.xlabel("PM2.5 (µg/m³)")
-    plt.ylabel("Frequency")
+    ax = new_axes(fig, (8,6))
+    # bin in NumPy and hand Matplotlib just the 40 bars
+    counts, edges = np.histogram(df["pm2_5"].dropna().to_numpy(), bins=40)
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align="edge")
+    ax.set_title("Histogram of PM2.5")
+    ax.set_xlabel("PM2.5 (µg/m³)")
+    ax.set_ylabel("Frequency")
 
-    plt.tight_layout()
-    plt.savefig(PROCESSED_DIR / "hist_pm2_5.png")
-    plt.close()
+    fig.tight_layout()
+    fig.savefig(PROCESSED_DIR / "hist_pm2_5.png", dpi=100)
 
     # Bar chart of risk flags per city
-    plt.figure(figsize=(10,6))
-    risk_counts = df.groupby(["city","risk_flag"]).size().unstack(fill_value=0)
-    risk_counts.plot(kind="bar", stacked=False, figsize=(10,6))
-    plt.title("Risk Flags per City")
-    plt.xlabel("City")
-    plt.ylabel("Counts")
-    plt.tight_layout()
-    plt.savefig(PROCESSED_DIR / "bar_risk_per_city.png")
-    plt.close()
+    ax = new_axes(fig, (10,6))
+    risk_counts = df.groupby(["city","risk_flag"], sort=False, observed=True).size().unstack(fill_value=0)
+    risk_counts.plot(kind="bar", stacked=False, ax=ax)
+    ax.set_title("Risk Flags per City")
+    ax.set_xlabel("City")
+    ax.set_ylabel("Counts")
+    fig.tight_layout()
+    fig.savefig(PROCESSED_DIR / "bar_risk_per_city.png", dpi=100)
 
     # Line chart of hourly PM2.5 trends (average per hour per city)
-    plt.figure(figsize=(12,6))
-    hourly = df.groupby(["city","time"]).agg({"pm2_5":"mean"}).reset_index()
-    # downsample to hourly-of-day average for clearer line
-    hourly["hour"] = hourly["time"].dt.hour
-    for city, grp in hourly.groupby("city"):
-        grp2 = grp.groupby("hour")["pm2_5"].mean().reset_index()
-        plt.plot(grp2["hour"], grp2["pm2_5"], label=city)
-    plt.legend()
-    plt.title("Hourly Average PM2.5 by City (hour of day)")
-    plt.xlabel("Hour of Day")
-    plt.ylabel("PM2.5 (µg/m³)")
-    plt.tight_layout()
-    
-    plt.savefig(PROCESSED_DIR / "line_hourly_pm2_5.png")
-    plt.close()
+    ax = new_axes(fig, (12,6))
+    # downsample to hourly-of-day average for clearer line: one
+    # hour × city matrix in a single grouping pass, plotted with one call
+    matrix = df.pivot_table(values="pm2_5", index="hour", columns="city", aggfunc="mean", observed=True)
+    ax.plot(matrix.index, matrix.to_numpy())
+    ax.legend(matrix.columns)
+    ax.set_title("Hourly Average PM2.5 by City (hour of day)")
+    ax.set_xlabel("Hour of Day")
+    ax.set_ylabel("PM2.5 (µg/m³)")
+    fig.tight_layout()
+
+    fig.savefig(PROCESSED_DIR / "line_hourly_pm2_5.png", dpi=100)
 
     # Scatter: severity_score vs pm2_5
-    plt.figure(figsize=(8,6))
-    sample = df.dropna(subset=["severity_score","pm2_5"])
-    plt.scatter(sample["pm2_5"], sample["severity_score"], alpha=0.6)
-    plt.xlabel("PM2.5")
-    plt.ylabel("Severity Score")
-    plt.title("Severity Score vs PM2.5")
-    plt.tight_layout()
-    plt.savefig(PROCESSED_DIR / "scatter_severity_pm2_5.png")
-    plt.close()
+    ax = new_axes(fig, (8,6))
+    points = df.dropna(subset=["severity_score","pm2_5"])
+    # 2-D density binned in NumPy: one rasterized collection instead of
+    # one marker per row, so every point can be kept
+    hb = ax.hexbin(points["pm2_5"], points["severity_score"], gridsize=80, mincnt=1,
+                   linewidths=0, rasterized=True)
+    fig.colorbar(hb, ax=ax, label="Hours")
+    ax.set_xlabel("PM2.5")
+    ax.set_ylabel("Severity Score")
+    ax.set_title("Severity Score vs PM2.5")
+    fig.tight_layout()
+    fig.savefig(PROCESSED_DIR / "scatter_severity_pm2_5.png", dpi=100)
+    plt.close(fig)
     print("Plots saved to data/processed/")
 
 def main():
@@ -171,6 +263,11 @@ def main():
         print("No data found in Supabase table.")
         return
 
+    # Sort once so every later groupby walks contiguous city/time runs
+    df = df.sort_values(["city","time"]).reset_index(drop=True)
+    df["hour"] = df["time"].dt.hour
+    df = ensure_c_contiguous(df)
+
     # KPI metrics
     summary_df, risk_dist, avg_pm25, avg_sev = compute_kpis(df)
 
@@ -1,7 +1,8 @@
 import os
-import json
-import time
-import requests
+import orjson
+import asyncio
+import aiohttp
+import aiofiles
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -17,7 +18,11 @@ CITIES = os.getenv("AQ_CITIES").split(",")
 
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))
 TIMEOUT = int(os.getenv("TIMEOUT_SECONDS", 10))
-SLEEP_BETWEEN = float(os.getenv("SLEEP_BETWEEN_CALLS", 0.5))
+BACKOFF_FACTOR = float(os.getenv("BACKOFF_FACTOR", 0.5))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 8))
+
+# Only transient server-side failures are worth retrying
+RETRY_STATUSES = {500, 502, 503, 504}
 
 RAW_DIR = os.getenv("RAW_DIR", "data/raw")
 os.makedirs(RAW_DIR, exist_ok=True)
@@ -37,62 +42,84 @@ CITY_COORDS = {
 # -------------------------------
 # REQUEST FUNCTION WITH RETRIES
 # -------------------------------
-def fetch_with_retry(url, city):
+async def fetch_with_retry(session, url, city):
     for attempt in range(1, MAX_RETRIES + 1):
         try:
             print(f"⏳ Fetching {city} (Attempt {attempt}/{MAX_RETRIES})...")
 
-            response = requests.get(url, timeout=TIMEOUT)
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return await response.json(loads=orjson.loads)
 
-            if response.status_code == 200:
-                return response.json()
+                print(f"⚠️ API Error {response.status} for {city}")
 
-            print(f"⚠️ API Error {response.status_code} for {city}")
+                if response.status not in RETRY_STATUSES:
+                    break
 
         except Exception as e:
             print(f"⚠️ Request failed for {city}: {e}")
 
-        time.sleep(1)  # backoff delay
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(BACKOFF_FACTOR * 2 ** (attempt - 1))  # exponential backoff
 
-    print(f"❌ Failed to fetch data for {city} after {MAX_RETRIES} attempts")
+    print(f"❌ Failed to fetch data for {city} after {attempt} attempt(s)")
     return None
 
 
+# -------------------------------
+# SAVE RAW JSON WITHOUT BLOCKING THE LOOP
+# -------------------------------
+async def save_raw(city, data):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filepath = os.path.join(RAW_DIR, f"{city}_raw_{timestamp}.json")
+
+    async with aiofiles.open(filepath, "wb") as f:
+        await f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+
+    print(f"✅ Saved raw data: {filepath}")
+    return filepath
+
+
+async def fetch_and_save(session, url, city):
+    data = await fetch_with_retry(session, url, city)
+
+    # If failed, log and continue
+    if data is None:
+        return None
+
+    return await save_raw(city, data)
+
+
 # -------------------------------
 # MAIN EXTRACTION FUNCTION
 # -------------------------------
 def extract_air_quality():
-    saved_files = []
-
+    # Build final URL dynamically for every city
+    requests_to_make = []
     for city in CITIES:
-
         lat, lon = CITY_COORDS[city]
-
-        # Build final URL dynamically
         url = (
             f"{API_BASE}"
             f"?latitude={lat}&longitude={lon}"
             f"&hourly={HOURLY_FIELDS}"
         )
-
-        data = fetch_with_retry(url, city)
-
-        # If failed, log and continue
-        if data is None:
-            continue
-
-        # Save raw JSON
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filepath = os.path.join(RAW_DIR, f"{city}_raw_{timestamp}.json")
-
-        with open(filepath, "w") as f:
-            json.dump(data, f, indent=4)
-
-        print(f"✅ Saved raw data: {filepath}")
-        saved_files.append(filepath)
-
-        time.sleep(SLEEP_BETWEEN)
-
+        requests_to_make.append((city, url))
+
+    # All cities are fetched concurrently over one session, so wall time
+    # is bounded by the slowest city instead of the sum of all of them.
+    async def _gather_all():
+        # One keep-alive connection pool: each host's TLS handshake is paid
+        # once and reused by every request and retry.
+        connector = aiohttp.TCPConnector(limit=POOL_SIZE)
+        timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            return await asyncio.gather(
+                *[fetch_and_save(session, url, city) for city, url in requests_to_make]
+            )
+
+    results = asyncio.run(_gather_all())
+
+    saved_files = [path for path in results if path is not None]
     return saved_files
 
 
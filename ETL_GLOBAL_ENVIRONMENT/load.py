@@ -147,13 +147,16 @@ def insert_batches(records: list):
                 time.sleep(LOAD_BACKOFF_SECONDS)
     return inserted
 
-def load_data():
-    if not os.path.exists(TRANSFORMED_FILE):
-        print("❌ No transformed file found. Run transform.py first!")
-        return
-
-    df = pd.read_csv(TRANSFORMED_FILE)
-    print(f"Loaded {len(df)} rows from staged file.")
+def load_data(df=None):
+    # The pipeline hands over the transformed frame directly; only re-read
+    # the staged file when run standalone.
+    if df is None:
+        if not os.path.exists(TRANSFORMED_FILE):
+            print("❌ No transformed file found. Run transform.py first!")
+            return
+
+        df = pd.read_csv(TRANSFORMED_FILE)
+        print(f"Loaded {len(df)} rows from staged file.")
 
     records = normalize_and_prepare(df)
     inserted = insert_batches(records)
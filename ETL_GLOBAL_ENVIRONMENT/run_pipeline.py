@@ -11,8 +11,8 @@ import time
 import traceback
 
 from extract import extract_air_quality       # correct function in your extract.py
-from transform import transform_data          # transform_data() takes NO arguments
-from load import load_data                    # load_data() takes NO arguments
+from transform import transform_data          # transform_data() returns the transformed DataFrame
+from load import load_data                    # load_data(df) loads it (reads the staged CSV if df is None)
 from etl_analysis import main as run_analysis # Analysis main()
     
 
@@ -44,10 +44,10 @@ def main():
     run_step("Extract Step", extract_air_quality)
 
     # 2️⃣ TRANSFORM
-    run_step("Transform Step", transform_data)
+    df = run_step("Transform Step", transform_data)
 
-    # 3️⃣ LOAD
-    run_step("Load Step (Supabase)", load_data)
+    # 3️⃣ LOAD (hand the DataFrame over in memory; no CSV re-read)
+    run_step("Load Step (Supabase)", load_data, df)
 
     # 4️⃣ ANALYSIS
     run_step("Analysis Step", run_analysis)
@@ -1,6 +1,9 @@
 import os
-import json
+import orjson
+from itertools import islice
+import numpy as np
 import pandas as pd
+from numba import njit, prange
 from datetime import datetime
 from pathlib import Path
 
@@ -10,35 +13,63 @@ STAGED_DIR = "data/staged"
 os.makedirs(STAGED_DIR, exist_ok=True)
 
 OUTPUT_FILE = os.path.join(STAGED_DIR, "air_quality_transformed.csv")
+PARQUET_FILE = os.path.join(STAGED_DIR, "air_quality_transformed.parquet")
+
+# Hourly pollutant fields read from every raw file, in staged column order
+HOURLY_FIELDS = [
+    "pm10", "pm2_5", "carbon_monoxide",
+    "nitrogen_dioxide", "sulphur_dioxide",
+    "ozone", "uv_index"
+]
+
+RAW_COLUMNS = ["city", "time"] + HOURLY_FIELDS
 
 # ---------------------------
 # AQI Category (PM2.5 Based)
 # ---------------------------
+# Upper bound (inclusive) of every band but the last
+AQI_THRESHOLDS = np.array([50, 100, 200, 300])
+AQI_LABELS = np.array(["Good", "Moderate", "Unhealthy", "Very Unhealthy", "Hazardous"], dtype=object)
+
+
 def aqi_category(pm25):
-    if pd.isna(pm25):
-        return "Unknown"
-    if pm25 <= 50:
-        return "Good"
-    elif pm25 <= 100:
-        return "Moderate"
-    elif pm25 <= 200:
-        return "Unhealthy"
-    elif pm25 <= 300:
-        return "Very Unhealthy"
-    else:
-        return "Hazardous"
+    # searchsorted(side="left") finds the first band whose upper bound is
+    # >= pm25: a branchless lookup, so 50 → Good, 100 → Moderate, etc.
+    values = pm25.to_numpy()
+    category = AQI_LABELS[np.searchsorted(AQI_THRESHOLDS, values, side="left")]
+    category[np.isnan(values)] = "Unknown"
+    return category
 
 
 # ---------------------------
 # Risk Classification
 # ---------------------------
+RISK_THRESHOLDS = np.array([200, 400])
+RISK_LABELS = np.array(["Low Risk", "Moderate Risk", "High Risk"], dtype=object)
+
+
 def classify_risk(severity):
-    if severity > 400:
-        return "High Risk"
-    elif severity > 200:
-        return "Moderate Risk"
-    else:
-        return "Low Risk"
+    values = severity.to_numpy()
+    risk = RISK_LABELS[np.searchsorted(RISK_THRESHOLDS, values, side="left")]
+    # NaN sorts past every threshold; a missing score is not a high risk
+    risk[np.isnan(values)] = "Low Risk"
+    return risk
+
+
+# ---------------------------
+# Severity Score
+# ---------------------------
+@njit(parallel=True, cache=True)
+def _severity(pm25, pm10, no2, so2, co, oz):
+    # One fused pass over the inputs instead of six temporary arrays.
+    # No fastmath: missing readings must still propagate as NaN.
+    out = np.empty_like(pm25)
+    for i in prange(pm25.size):
+        out[i] = (
+            pm25[i] * 5 + pm10[i] * 3 + no2[i] * 4
+            + so2[i] * 4 + co[i] * 2 + oz[i] * 3
+        )
+    return out
 
 
 # ---------------------------
@@ -46,7 +77,8 @@ def classify_risk(severity):
 # ---------------------------
 def transform_data():
 
-    all_rows = []
+    # One growing list per output column; every file extends them in place
+    col_buffers = {name: [] for name in RAW_COLUMNS}
 
     raw_files = list(Path(RAW_DIR).glob("*.json"))
 
@@ -57,8 +89,7 @@ def transform_data():
     for file in raw_files:
         city = file.name.split("_")[0]
 
-        with open(file, "r") as f:
-            data = json.load(f)
+        data = orjson.loads(file.read_bytes())
 
         if "hourly" not in data:
             print(f" Skipping {file} — No 'hourly' field")
@@ -66,42 +97,30 @@ def transform_data():
 
         hourly = data["hourly"]
 
-        times = hourly.get("time", [])
-        pm10 = hourly.get("pm10", [])
-        pm25 = hourly.get("pm2_5", [])
-        co = hourly.get("carbon_monoxide", [])
-        no2 = hourly.get("nitrogen_dioxide", [])
-        so2 = hourly.get("sulphur_dioxide", [])
-        ozone = hourly.get("ozone", [])
-        uv = hourly.get("uv_index", [])
-
-        rows = zip(times, pm10, pm25, co, no2, so2, ozone, uv)
-
-        for t, p10, p25, co_v, no2_v, so2_v, oz_v, uv_v in rows:
-            row = {
-                "city": city,
-                "time": t,
-                "pm10": p10,
-                "pm2_5": p25,
-                "carbon_monoxide": co_v,
-                "nitrogen_dioxide": no2_v,
-                "sulphur_dioxide": so2_v,
-                "ozone": oz_v,
-                "uv_index": uv_v,
-            }
-            all_rows.append(row)
-
-    df = pd.DataFrame(all_rows)
+        # Copy the hourly arrays column by column; columns are cut to the
+        # shortest one, like zip() would.
+        columns = {"time": hourly.get("time", [])}
+        for field in HOURLY_FIELDS:
+            columns[field] = hourly.get(field, [])
+        n = min(len(values) for values in columns.values())
+
+        col_buffers["city"].extend([city] * n)
+        for name, values in columns.items():
+            col_buffers[name].extend(islice(values, n))
+
+    if not col_buffers["city"]:
+        print(" No usable raw files found in data/raw/.")
+        return
+
+    # No forced dtypes here: a malformed raw value must not abort the run,
+    # it is coerced to NaN by the to_numeric pass below
+    df = pd.DataFrame(col_buffers, copy=False)
 
     # Convert time → datetime
     df["time"] = pd.to_datetime(df["time"], errors="coerce")
 
     # Convert numeric columns
-    num_cols = [
-        "pm10", "pm2_5", "carbon_monoxide",
-        "nitrogen_dioxide", "sulphur_dioxide",
-        "ozone", "uv_index"
-    ]
+    num_cols = HOURLY_FIELDS
 
     for col in num_cols:
         df[col] = pd.to_numeric(df[col], errors="coerce")
@@ -110,25 +129,30 @@ def transform_data():
     df.dropna(subset=num_cols, how="all", inplace=True)
 
     # Feature Engineering
-    df["AQI_Category"] = df["pm2_5"].apply(aqi_category)
-
-    df["severity"] = (
-        (df["pm2_5"] * 5) +
-        (df["pm10"] * 3) +
-        (df["nitrogen_dioxide"] * 4) +
-        (df["sulphur_dioxide"] * 4) +
-        (df["carbon_monoxide"] * 2) +
-        (df["ozone"] * 3)
+    df["AQI_Category"] = aqi_category(df["pm2_5"])
+
+    df["severity"] = _severity(
+        df["pm2_5"].to_numpy(dtype=np.float64),
+        df["pm10"].to_numpy(dtype=np.float64),
+        df["nitrogen_dioxide"].to_numpy(dtype=np.float64),
+        df["sulphur_dioxide"].to_numpy(dtype=np.float64),
+        df["carbon_monoxide"].to_numpy(dtype=np.float64),
+        df["ozone"].to_numpy(dtype=np.float64),
     )
 
-    df["Risk_Level"] = df["severity"].apply(classify_risk)
+    df["Risk_Level"] = classify_risk(df["severity"])
 
     df["hour"] = df["time"].dt.hour
 
+    df["city"] = pd.Categorical(df["city"])
+
     # Save final staged file
     df.to_csv(OUTPUT_FILE, index=False)
+    # Columnar copy with dtypes intact, read directly by etl_analysis.py
+    df.to_parquet(PARQUET_FILE, compression="snappy", index=False)
 
-    print(f" Transform completed! File saved to:\n{OUTPUT_FILE}")
+    print(f" Transform completed! Files saved to:\n{OUTPUT_FILE}\n{PARQUET_FILE}")
+    return df
 
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@ import os
 import pandas as pd
 import numpy as np
 import time
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
 from postgrest.exceptions import APIError
 from dotenv import load_dotenv
@@ -44,6 +45,19 @@ def create_table():
             print("➡ Make sure you created the SQL function execute_sql in Supabase:")
             print("""Run inside Supabase SQL editor""")
             exit()
+def insert_batch(batch, start, end):
+    attempts = 0
+    while attempts < 3:
+        try:
+            supabase.table("churn_data").insert(batch).execute()
+            print(f" Uploaded batch {start} → {end}")
+            return
+        except Exception as e:
+            attempts += 1
+            print(f" Retry {attempts}/3 for batch {start}-{end}")
+            print("Error:", e)
+            time.sleep(2)
+    raise RuntimeError(f"Could NOT upload batch {start}-{end} even after retries.")
 def load_data():
     base_dir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     staged_path=os.path.join(base_dir, "data","staged","churn_transformed.csv")
@@ -62,34 +76,26 @@ def load_data():
     df = df.replace({np.nan: None})
     rows = df.to_dict(orient="records")
     total = len(rows)
-    batch_size = 200
+    # Larger batches mean fewer PostgREST round-trips; they are sent
+    # concurrently so client and server work overlap.
+    batch_size = 1000
+    max_workers = 8
 
     print(f" Uploading {total} records to Supabase...")
 
-    for start in range(0, total, batch_size):
-        end = min(start + batch_size, total)
-        batch = rows[start:end]
-
-        attempts = 0
-        success = False
-
-        while attempts < 3 and not success:
-            try:
-                supabase.table("churn_data").insert(batch).execute()
-                print(f" Uploaded batch {start} → {end}")
-                success = True
-
-            except Exception as e:
-                attempts += 1
-                print(f" Retry {attempts}/3 for batch {start}-{end}")
-                print("Error:", e)
-                time.sleep(2)
-
-        if not success:
-            print(f" Could NOT upload batch {start}-{end} even after retries.")
-            break
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(insert_batch, rows[start:start + batch_size], start, min(start + batch_size, total))
+            for start in range(0, total, batch_size)
+        ]
+    failed = [f.exception() for f in futures if f.exception() is not None]
+    for err in failed:
+        print(f" {err}")
 
-    print("🎉 Upload completed successfully!")
+    if failed:
+        print(f" Upload finished with {len(failed)} failed batch(es).")
+    else:
+        print("🎉 Upload completed successfully!")
 
 
 # ---------------------------------------------------------